@@ -0,0 +1,129 @@
+"""
+In-memory index over controller metadata.
+
+Keeps file names sorted for cursor pagination and maintains cluster-wide
+aggregates incrementally, so listing and the dashboard never walk the full
+metadata on each request. The index has its own short-held lock, so readers
+never wait on the controller's metadata lock.
+"""
+import bisect
+import threading
+from collections import Counter
+
+
+def chunk_lengths(record):
+    """Byte length of each chunk index, derived from the recorded sizes"""
+    size, chunk_size = record.get("size"), record.get("chunk_size")
+    count = record["chunk_count"]
+    if size is None or not chunk_size:
+        return {}
+    return {i: min(chunk_size, size - i * chunk_size) for i in range(count)}
+
+
+class FileIndex:
+    def __init__(self, replication_factor, source=None):
+        self.replication_factor = replication_factor
+        self.source = source
+        # Held by readers that need several calls to see one consistent state
+        self.lock = threading.RLock()
+        self.names = []
+        self.files = {}
+        self.node_chunks = Counter()
+        self.node_bytes = Counter()
+        self.total_bytes = 0
+        self.total_chunks = 0
+        self.under_replicated = 0
+
+    @classmethod
+    def build(cls, metadata, replication_factor, source=None):
+        index = cls(replication_factor, source)
+        index.names = sorted(metadata)
+        for name, record in metadata.items():
+            index._add(name, record)
+        return index
+
+    def _add(self, name, record):
+        lengths = chunk_lengths(record)
+        replicas = Counter()
+        nodes = Counter()
+        node_bytes = Counter()
+        for entry in record["chunks"]:
+            replicas[entry["index"]] += 1
+            nodes[entry["node"]] += 1
+            node_bytes[entry["node"]] += lengths.get(entry["index"], 0)
+        under = sum(
+            1 for i in range(record["chunk_count"])
+            if replicas[i] < self.replication_factor
+        )
+        self.files[name] = {
+            "size": record.get("size"),
+            "chunk_count": record["chunk_count"],
+            "chunk_size": record.get("chunk_size"),
+            "under_replicated": under,
+            "nodes": nodes,
+            "node_bytes": node_bytes,
+        }
+        self.node_chunks.update(nodes)
+        self.node_bytes.update(node_bytes)
+        self.total_bytes += record.get("size") or 0
+        self.total_chunks += record["chunk_count"]
+        self.under_replicated += under
+
+    def put(self, name, record):
+        with self.lock:
+            if name in self.files:
+                self.remove(name)
+            bisect.insort(self.names, name)
+            self._add(name, record)
+
+    def remove(self, name):
+        with self.lock:
+            info = self.files.pop(name, None)
+            if info is None:
+                return
+            del self.names[bisect.bisect_left(self.names, name)]
+            self.node_chunks.subtract(info["nodes"])
+            self.node_bytes.subtract(info["node_bytes"])
+            self.total_bytes -= info["size"] or 0
+            self.total_chunks -= info["chunk_count"]
+            self.under_replicated -= info["under_replicated"]
+
+    def _prefix_bounds(self, prefix):
+        lo = bisect.bisect_left(self.names, prefix)
+        if not prefix:
+            return lo, len(self.names)
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return lo, bisect.bisect_left(self.names, upper)
+
+    def page(self, prefix="", cursor=None, limit=100):
+        """Names after cursor that start with prefix; returns (names, next_cursor, total)"""
+        with self.lock:
+            lo, hi = self._prefix_bounds(prefix)
+            start = max(lo, bisect.bisect_right(self.names, cursor)) if cursor else lo
+            names = self.names[start:min(start + limit, hi)]
+            next_cursor = names[-1] if names and start + len(names) < hi else None
+            return names, next_cursor, hi - lo
+
+    def describe(self, name):
+        info = self.files[name]
+        return {
+            "name": name,
+            "size": info["size"],
+            "chunk_count": info["chunk_count"],
+            "chunk_size": info["chunk_size"],
+            "under_replicated_chunks": info["under_replicated"],
+        }
+
+    def summary(self):
+        with self.lock:
+            return {
+                "files": len(self.names),
+                "bytes": self.total_bytes,
+                "chunks": self.total_chunks,
+                "under_replicated_chunks": self.under_replicated,
+                "nodes": {
+                    node: {"chunks": count, "bytes": self.node_bytes[node]}
+                    for node, count in sorted(self.node_chunks.items())
+                    if count > 0
+                },
+            }
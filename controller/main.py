@@ -1,17 +1,25 @@
-from fastapi import FastAPI, UploadFile, File, Depends, Header, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Depends, Header, HTTPException, BackgroundTasks, Query
+from fastapi.responses import FileResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Set, List
-import os, json, shutil, random, requests
+from typing import Set, List, Optional
+import os, json, shutil, random, requests, time, hashlib, math, threading, uuid, tempfile
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 
-from utils.file_utils import split_file, assemble_file
+from utils.file_utils import (
+    split_file, assemble_file, choose_chunk_size, chunk_span,
+    MIN_CHUNK_SIZE, MAX_CHUNK_SIZE, TARGET_CHUNK_COUNT,
+)
+from utils.metrics import Registry, SamplingProfiler, instrument_app
+from controller.file_index import FileIndex, chunk_lengths
+from controller.recovery import fetch_inventories, merge_metadata, rebuild_metadata, reconcile
+from controller.scheduler import TransferScheduler
 
 # Templates for dashboard
-templates = Jinja2Templates(directory="controller/templates")
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
 
 app = FastAPI()
 
@@ -23,8 +31,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-METADATA_FILE = "controller/metadata.json"
-REPLICATION_FACTOR = 2  # store each chunk on 2 nodes
+METADATA_FILE = os.getenv("METADATA_FILE", "controller/metadata.json")
+REPLICATION_FACTOR = int(os.getenv("REPLICATION_FACTOR", "2"))  # store each chunk on 2 nodes
+# Chunk size is picked per file unless CHUNK_SIZE pins it (0 = adaptive)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "0"))
+CHUNK_MIN_SIZE = int(os.getenv("CHUNK_MIN_SIZE", str(MIN_CHUNK_SIZE)))
+CHUNK_MAX_SIZE = int(os.getenv("CHUNK_MAX_SIZE", str(MAX_CHUNK_SIZE)))
+CHUNK_TARGET_COUNT = int(os.getenv("CHUNK_TARGET_COUNT", str(TARGET_CHUNK_COUNT)))
+# Registered nodes are persisted next to metadata unless NODES_FILE is set
+NODES_FILE = os.getenv("NODES_FILE")
+# Unreferenced chunks younger than this may belong to an in-flight upload
+ORPHAN_GRACE_SECONDS = int(os.getenv("ORPHAN_GRACE_SECONDS", "3600"))
+
+# Transfer scheduling: per-tenant byte rate (0 = unlimited), optional
+# per-tenant overrides as JSON {"tenant": {"rate": .., "burst": .., "weight": ..}}
+TENANT_RATE = int(os.getenv("TENANT_RATE", "0"))
+TENANT_BURST = int(os.getenv("TENANT_BURST", "0"))
+TENANT_LIMITS = json.loads(os.getenv("TENANT_LIMITS", "{}"))
+TENANT_MAX_DELAY = float(os.getenv("TENANT_MAX_DELAY", "5"))  # seconds before 429
+QUEUE_RETRY_AFTER = int(os.getenv("QUEUE_RETRY_AFTER", "1"))
+SCHEDULER = TransferScheduler(
+    TENANT_RATE, TENANT_BURST, TENANT_LIMITS,
+    workers_per_node=int(os.getenv("NODE_TRANSFER_WORKERS", "4")),
+    max_pending_per_node=int(os.getenv("NODE_QUEUE_LIMIT", "256")),
+    flow_window=int(os.getenv("FLOW_WINDOW", "8")),
+)
+
+# Uploads, deletes and recovery all read-modify-write the metadata file
+METADATA_LOCK = threading.RLock()
 
 # API Key for auth (use docker env)
 API_KEY = os.getenv("API_KEY", "supersecret")
@@ -33,57 +67,184 @@ def verify_token(x_api_key: str = Header(...)):
     if x_api_key != API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+# Metrics exposed on /metrics, profiler toggled via /debug/profiler
+METRICS = Registry()
+PROFILER = SamplingProfiler()
+instrument_app(app, METRICS, PROFILER, dependencies=[Depends(verify_token)])
+if os.getenv("PROFILER_ENABLED") == "1":
+    PROFILER.start(float(os.getenv("PROFILER_INTERVAL", "0.01")))
+
+NODE_REQUESTS = METRICS.counter(
+    "controller_node_requests_total", "Requests sent to storage nodes", ("node", "op")
+)
+NODE_ERRORS = METRICS.counter(
+    "controller_node_errors_total", "Failed requests to storage nodes", ("node", "op")
+)
+NODE_BYTES = METRICS.counter(
+    "controller_node_bytes_total", "Chunk bytes moved to or from storage nodes", ("node", "direction")
+)
+NODE_IN_FLIGHT = METRICS.gauge(
+    "controller_node_transfers_in_flight", "Chunk transfers currently in progress", ("node",)
+)
+CHUNK_SECONDS = METRICS.histogram(
+    "controller_chunk_operation_seconds", "Time spent splitting, assembling and transferring chunks", ("op",)
+)
+METADATA_SECONDS = METRICS.histogram(
+    "controller_metadata_operation_seconds", "Time spent loading and saving metadata", ("op",)
+)
+ADMISSION_REJECTIONS = METRICS.counter(
+    "controller_admission_rejections_total", "Requests rejected with 429", ("reason",)
+)
+
+def get_tenant(x_tenant_id: Optional[str] = Header(None), x_api_key: Optional[str] = Header(None)):
+    # X-Tenant-ID is only honoured for configured tenants; any other value
+    # would hand the client a fresh bucket and let it dodge its rate limit
+    if x_tenant_id in SCHEDULER.tenants:
+        return x_tenant_id
+    return "api" if x_api_key == API_KEY else "anonymous"
+
+def admit(tenant):
+    # Reject instead of queueing when the tenant is too far over its rate
+    delay = SCHEDULER.bucket(tenant).delay()
+    if delay > TENANT_MAX_DELAY:
+        ADMISSION_REJECTIONS.inc(reason="rate_limit")
+        raise HTTPException(
+            status_code=429,
+            detail="Tenant transfer rate exceeded",
+            headers={"Retry-After": str(math.ceil(delay))},
+        )
+
+def reject_saturated():
+    # Queue limits are reached: shed load rather than block in NodeQueue.submit
+    ADMISSION_REJECTIONS.inc(reason="node_saturated")
+    raise HTTPException(
+        status_code=429,
+        detail="Storage node queues are saturated",
+        headers={"Retry-After": str(QUEUE_RETRY_AFTER)},
+    )
+
+def nodes_file():
+    return NODES_FILE or os.path.join(os.path.dirname(METADATA_FILE), "nodes.json")
+
+def load_nodes():
+    try:
+        with open(nodes_file()) as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+def save_nodes():
+    write_json_atomic(nodes_file(), sorted(REGISTERED_NODES))
+
+def write_json_atomic(path, data):
+    # Write to a temp file first so a crash never leaves a truncated file
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
 # Track registered nodes
-REGISTERED_NODES: Set[str] = set()
+REGISTERED_NODES: Set[str] = load_nodes()
+
+# Last health check results, refreshed in the background for the dashboard
+HEALTH_CACHE_SECONDS = 10
+HEALTH_STATE = {"checked_at": 0.0, "healthy": []}
+DASHBOARD_PAGE_SIZE = 50
+
+# Sorted names and aggregates over metadata, built on first use
+FILE_INDEX: Optional[FileIndex] = None
 
 class NodeInfo(BaseModel):
     node_url: str
 
+def upgrade_record(record):
+    # Older metadata stored a bare list of {chunk, node} entries in upload order
+    if isinstance(record, dict):
+        record.setdefault("chunk_count", len({e["index"] for e in record["chunks"]}))
+        return record
+    indexes = {}
+    for entry in record:
+        entry["index"] = indexes.setdefault(entry["chunk"], len(indexes))
+    return {"size": None, "chunk_size": None, "chunk_count": len(indexes), "chunks": record}
+
 def load_metadata():
     if not os.path.exists(METADATA_FILE):
         return {}
-    with open(METADATA_FILE, 'r') as f:
-        return json.load(f)
+    with METADATA_SECONDS.time(op="load"), open(METADATA_FILE, 'r') as f:
+        metadata = json.load(f)
+    return {name: upgrade_record(record) for name, record in metadata.items()}
 
 def save_metadata(data):
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    with METADATA_SECONDS.time(op="save"):
+        write_json_atomic(METADATA_FILE, data)
+
+def _index_current(index):
+    return (index is not None and index.source == METADATA_FILE
+            and index.replication_factor == REPLICATION_FACTOR)
+
+def file_index():
+    global FILE_INDEX
+    # A published index is kept up to date by writers, so reads skip the lock
+    index = FILE_INDEX
+    if _index_current(index):
+        return index
+    with METADATA_LOCK:
+        # Build under the lock so a concurrent upload cannot land between
+        # reading metadata and publishing the index
+        if not _index_current(FILE_INDEX):
+            FILE_INDEX = FileIndex.build(load_metadata(), REPLICATION_FACTOR, METADATA_FILE)
+        return FILE_INDEX
+
+def invalidate_file_index():
+    global FILE_INDEX
+    FILE_INDEX = None
 
 @app.get("/dashboard")
-def dashboard(request: Request):
-    metadata = load_metadata()
-    nodes = list(REGISTERED_NODES)
-    healthy_nodes = get_healthy_nodes()
+def dashboard(request: Request, background_tasks: BackgroundTasks,
+              prefix: str = "", cursor: Optional[str] = None):
+    index = file_index()
+    with index.lock:
+        names, next_cursor, total = index.page(prefix, cursor, DASHBOARD_PAGE_SIZE)
+        summary = index.summary()
+        files = [index.describe(name) for name in names]
+    if time.time() - HEALTH_STATE["checked_at"] > HEALTH_CACHE_SECONDS:
+        background_tasks.add_task(get_healthy_nodes)
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
-        "nodes": nodes,
-        "healthy_nodes": healthy_nodes,
-        "metadata": metadata,
+        "nodes": sorted(REGISTERED_NODES),
+        "healthy_nodes": HEALTH_STATE["healthy"],
+        "health_checked_at": HEALTH_STATE["checked_at"],
+        "summary": summary,
+        "files": files,
+        "total": total,
+        "prefix": prefix,
+        "next_cursor": next_cursor,
     })
 
 @app.get("/files")
-def list_uploaded_files():
-    metadata = load_metadata()
-    return {"files": list(metadata.keys())}
+def list_uploaded_files(prefix: str = "", cursor: Optional[str] = None,
+                        limit: int = Query(100, ge=1, le=1000), detail: bool = False):
+    index = file_index()
+    with index.lock:
+        names, next_cursor, total = index.page(prefix, cursor, limit)
+        response = {"files": names, "next_cursor": next_cursor, "total": total}
+        if detail:
+            response["items"] = [index.describe(name) for name in names]
+    return response
 
 
 @app.delete("/delete/{filename}")
 def delete_file(filename: str):
-    metadata = load_metadata()
-    if filename not in metadata:
-        return {"error": "File not found in metadata"}
-
-    for entry in metadata[filename]:
-        node = entry["node"]
-        chunk = entry["chunk"]
-        try:
-            requests.delete(f"{node}/delete_chunk/{chunk}")
-        except Exception as e:
-            print(f"Failed to delete {chunk} from {node}: {e}")
-
-    del metadata[filename]
-    save_metadata(metadata)
+    with METADATA_LOCK:
+        metadata = load_metadata()
+        if filename not in metadata:
+            return {"error": "File not found in metadata"}
+
+        record = metadata.pop(filename)
+        save_metadata(metadata)
+        file_index().remove(filename)
+    # Node requests happen outside the lock so uploads and listings don't wait on them
+    delete_chunks(record["chunks"])
     return {"message": f"{filename} deleted"}
 
 
@@ -91,101 +252,351 @@ def delete_file(filename: str):
 
 @app.post("/register")
 def register_node(info: NodeInfo):
-    REGISTERED_NODES.add(info.node_url)
-    print(f"[REGISTER] Node registered: {info.node_url}")
+    if info.node_url not in REGISTERED_NODES:
+        REGISTERED_NODES.add(info.node_url)
+        save_nodes()
+        print(f"[REGISTER] Node registered: {info.node_url}")
     return {"message": "Node registered", "total": len(REGISTERED_NODES)}
 
 @app.get("/nodes")
 def list_registered_nodes():
     return {"nodes": list(REGISTERED_NODES)}
 
+@app.get("/health")
+def health():
+    return {"status": "ok", "registered_nodes": len(REGISTERED_NODES)}
+
 def get_healthy_nodes():
     healthy = []
     for node in REGISTERED_NODES:
+        NODE_REQUESTS.inc(node=node, op="health")
         try:
             res = requests.get(f"{node}/health", timeout=1)
             if res.status_code == 200:
                 healthy.append(node)
         except:
+            NODE_ERRORS.inc(node=node, op="health")
             print(f"[HEALTH] {node} is DOWN.")
+    HEALTH_STATE.update(checked_at=time.time(), healthy=healthy)
     return healthy
 
-def send_chunk_to_node(node_url, chunk_name, chunk_data):
+def send_chunk_to_node(node_url, chunk_name, chunk_data, manifest=None):
+    NODE_REQUESTS.inc(node=node_url, op="store")
     try:
-        res = requests.post(
-            f"{node_url}/store_chunk",
-            params={"filename": chunk_name},
-            files={"file": (chunk_name, chunk_data)}
-        )
-        return res.status_code == 200
+        with NODE_IN_FLIGHT.track_inprogress(node=node_url), CHUNK_SECONDS.time(op="store"):
+            res = requests.post(
+                f"{node_url}/store_chunk",
+                params={"filename": chunk_name, **(manifest or {})},
+                files={"file": (chunk_name, chunk_data)}
+            )
+        if res.status_code == 200:
+            NODE_BYTES.inc(len(chunk_data), node=node_url, direction="sent")
+            return True
+        NODE_ERRORS.inc(node=node_url, op="store")
+        return False
     except Exception as e:
+        NODE_ERRORS.inc(node=node_url, op="store")
         print(f"Error sending to {node_url}: {e}")
         return False
 
 def get_chunk_from_node(node_url, chunk_name):
+    NODE_REQUESTS.inc(node=node_url, op="fetch")
     try:
-        res = requests.get(f"{node_url}/get_chunk/{chunk_name}")
+        with NODE_IN_FLIGHT.track_inprogress(node=node_url), CHUNK_SECONDS.time(op="fetch"):
+            res = requests.get(f"{node_url}/get_chunk/{chunk_name}")
         if res.status_code == 200:
+            NODE_BYTES.inc(len(res.content), node=node_url, direction="received")
             return res.content
     except:
         pass
+    NODE_ERRORS.inc(node=node_url, op="fetch")
     return None
 
+def delete_chunks(chunks):
+    deleted = 0
+    for item in chunks:
+        NODE_REQUESTS.inc(node=item["node"], op="delete")
+        try:
+            requests.delete(f"{item['node']}/delete_chunk/{item['chunk']}", timeout=10)
+            deleted += 1
+        except Exception as e:
+            NODE_ERRORS.inc(node=item["node"], op="delete")
+            print(f"Failed to delete {item['chunk']} from {item['node']}: {e}")
+    return deleted
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)): #, token: str = Depends(verify_token)):
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as buffer:
+def upload_file(file: UploadFile = File(...), tenant: str = Depends(get_tenant)): #, token: str = Depends(verify_token)):
+    admit(tenant)
+    # Each request is its own flow in the per-node fair queues. The flow id
+    # also keeps chunk names of concurrent uploads of the same file apart.
+    flow = uuid.uuid4().hex
+    name, ext = os.path.splitext(file.filename)
+    with tempfile.NamedTemporaryFile(prefix="upload_", delete=False) as buffer:
+        temp_path = buffer.name
         shutil.copyfileobj(file.file, buffer)
-
-    chunks = split_file(temp_path)
-    os.remove(temp_path)
+    try:
+        file_size = os.path.getsize(temp_path)
+        chunk_size = CHUNK_SIZE or choose_chunk_size(
+            file_size, CHUNK_MIN_SIZE, CHUNK_MAX_SIZE, CHUNK_TARGET_COUNT
+        )
+        with CHUNK_SECONDS.time(op="split"):
+            chunks = split_file(temp_path, chunk_size=chunk_size, base_name=f"{name}_{flow[:12]}{ext}")
+    finally:
+        os.remove(temp_path)
 
     healthy_nodes = get_healthy_nodes()
     if len(healthy_nodes) < REPLICATION_FACTOR:
         return {
             "error": f"Not enough healthy nodes to replicate. Needed {REPLICATION_FACTOR}, got {len(healthy_nodes)}"
         }
-
-    metadata = load_metadata()
-    metadata[file.filename] = []
-
-    for chunk_name, chunk_data in chunks:
-        nodes = random.sample(healthy_nodes, REPLICATION_FACTOR)
+    available_nodes = [node for node in healthy_nodes if not SCHEDULER.saturated(node)]
+    if len(available_nodes) < REPLICATION_FACTOR:
+        reject_saturated()
+
+    record = {"size": file_size, "chunk_size": chunk_size, "chunk_count": len(chunks),
+              "uploaded_at": time.time(), "chunks": []}
+
+    transfers = []
+    for index, (chunk_name, chunk_data) in enumerate(chunks):
+        checksum = hashlib.sha256(chunk_data).hexdigest()
+        # Sidecar manifest kept by the node so metadata can be rebuilt from it
+        manifest = {
+            "owner": file.filename, "index": index, "checksum": checksum,
+            "uploaded_at": record["uploaded_at"], "file_size": file_size,
+            "chunk_size": chunk_size, "chunk_count": len(chunks),
+        }
+        nodes = random.sample(available_nodes, REPLICATION_FACTOR)
         for node in nodes:
-            success = send_chunk_to_node(node, chunk_name, chunk_data)
-            if success:
-                metadata[file.filename].append({"chunk": chunk_name, "node": node})
-            else:
-                print(f"Failed to store {chunk_name} on {node}")
+            future = SCHEDULER.submit(
+                tenant, flow, node, len(chunk_data),
+                send_chunk_to_node, node, chunk_name, chunk_data, manifest,
+            )
+            transfers.append((index, chunk_name, checksum, node, future))
+
+    for index, chunk_name, checksum, node, future in transfers:
+        if future.result():
+            record["chunks"].append(
+                {"chunk": chunk_name, "index": index, "node": node, "checksum": checksum}
+            )
+        else:
+            print(f"Failed to store {chunk_name} on {node}")
+
+    # An incomplete upload must not replace the previous version of the file
+    stored = {entry["index"] for entry in record["chunks"]}
+    lost = [index for index in range(len(chunks)) if index not in stored]
+    if lost:
+        delete_chunks(record["chunks"])
+        raise HTTPException(
+            status_code=502,
+            detail=f"Chunk {lost[0]} of {file.filename} could not be stored on any node",
+        )
 
-    save_metadata(metadata)
+    with METADATA_LOCK:
+        metadata = load_metadata()
+        previous = metadata.get(file.filename)
+        metadata[file.filename] = record
+        save_metadata(metadata)
+        file_index().put(file.filename, record)
+    # Chunk names are unique per upload, so the replaced upload's chunks would linger
+    if previous:
+        delete_chunks(previous["chunks"])
     return {
         "message": f"{file.filename} uploaded and split into {len(chunks)} chunks with replication.",
+        "chunk_size": chunk_size,
         "used_nodes": healthy_nodes
     }
 
+def parse_range(header, size):
+    # Single "bytes=start-end" range, including open-ended and suffix forms
+    unit, _, spec = header.partition("=")
+    start_text, _, end_text = spec.strip().partition("-")
+    if unit.strip() != "bytes" or "," in spec or not (start_text or end_text):
+        raise HTTPException(status_code=416, detail="Unsupported range")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = min(int(end_text), size - 1) if end_text else size - 1
+        else:
+            start, end = max(0, size - int(end_text)), size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Malformed range")
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
 @app.get("/download/{filename}")
-def download_file(filename: str): #, token: str = Depends(verify_token)):
+def download_file(filename: str, range_header: Optional[str] = Header(None, alias="Range"),
+                  tenant: str = Depends(get_tenant)): #, token: str = Depends(verify_token)):
+    admit(tenant)
     metadata = load_metadata()
     if filename not in metadata:
         return {"error": "File not found."}
+    record = metadata[filename]
+    chunk_size = record["chunk_size"]
+
+    replicas = {}
+    for entry in record["chunks"]:
+        replicas.setdefault(entry["index"], []).append(entry)
+
+    indexes = range(record["chunk_count"] or len(replicas))
+    byte_range = None
+    if range_header and record["size"] is not None:
+        byte_range = parse_range(range_header, record["size"])
+        # Only fetch the chunks that overlap the requested bytes
+        first, last = chunk_span(*byte_range, chunk_size)
+        indexes = range(first, last + 1)
+
+    gaps = [index for index in indexes if index not in replicas]
+    if gaps:
+        return {"error": f"Chunk {gaps[0]} of {filename} has no replicas."}
+
+    # Read each chunk from a replica whose node queue has room first
+    for index in indexes:
+        replicas[index].sort(key=lambda entry: SCHEDULER.saturated(entry["node"]))
+        if SCHEDULER.saturated(replicas[index][0]["node"]):
+            reject_saturated()
+
+    # Fetch from the first replica through the fair queues, then fail over
+    flow = uuid.uuid4().hex
+    lengths = chunk_lengths(record)
+
+    def fetch(index, entry):
+        size = lengths.get(index, chunk_size or 0)
+        return SCHEDULER.submit(
+            tenant, flow, entry["node"], size, get_chunk_from_node, entry["node"], entry["chunk"]
+        )
 
-    chunks_map = {}
-    for entry in metadata[filename]:
-        chunks_map.setdefault(entry["chunk"], []).append(entry["node"])
+    def valid(index, entry, data):
+        # Nodes answer 200 with an error body for missing chunks, so check
+        # the length and checksum recorded at upload time
+        expected = lengths.get(index)
+        if data is None or (len(data) != expected if expected is not None else not data):
+            return False
+        return not entry.get("checksum") or hashlib.sha256(data).hexdigest() == entry["checksum"]
 
+    fetches = [(index, fetch(index, replicas[index][0])) for index in indexes]
     chunks = []
-    for chunk_name, node_list in chunks_map.items():
-        for node in node_list:
-            data = get_chunk_from_node(node, chunk_name)
-            if data:
-                chunks.append((chunk_name, data))
-                break
-        else:
-            return {"error": f"Chunk {chunk_name} is missing from all replicas."}
+    for index, future in fetches:
+        data = future.result()
+        if not valid(index, replicas[index][0], data):
+            data = None
+            for entry in replicas[index][1:]:
+                candidate = fetch(index, entry).result()
+                if valid(index, entry, candidate):
+                    data = candidate
+                    break
+        if data is None:
+            return {"error": f"Chunk {index} of {filename} failed verification on all replicas."}
+        chunks.append((index, data))
+
+    with CHUNK_SECONDS.time(op="assemble"):
+        content = assemble_file(chunks, chunk_size)
+
+    if byte_range is not None:
+        start, end = byte_range
+        offset = first * chunk_size
+        return Response(
+            content[start - offset:end - offset + 1],
+            status_code=206,
+            media_type="application/octet-stream",
+            headers={"Content-Range": f"bytes {start}-{end}/{record['size']}"},
+        )
 
-    output_path = f"reconstructed_{filename}"
-    with open(output_path, "wb") as f:
-        f.write(assemble_file(chunks))
+    with tempfile.NamedTemporaryFile(prefix="download_", delete=False) as f:
+        f.write(content)
+
+    return FileResponse(
+        f.name, filename=filename, headers={"Accept-Ranges": "bytes"},
+        background=BackgroundTask(os.remove, f.name),
+    )
+
+@app.post("/recover", dependencies=[Depends(verify_token)])
+def recover_metadata(nodes: List[str] = Query([]), force: bool = False):
+    """Rebuild metadata and the node registry from node chunk inventories.
+
+    If any node cannot be scanned the rebuilt records are merged into the
+    existing metadata, so replicas on that node are not forgotten. force
+    replaces metadata with what the reachable nodes hold.
+    """
+    started = time.time()
+    with METADATA_LOCK:
+        inventories, failed = fetch_inventories(sorted(REGISTERED_NODES | set(nodes)))
+        metadata, unowned = rebuild_metadata(inventories)
+        merged = bool(failed) and not force
+        if merged:
+            metadata = merge_metadata(load_metadata(), metadata)
+        save_metadata(metadata)
+        REGISTERED_NODES.update(inventories)
+        save_nodes()
+        invalidate_file_index()
+    print(f"[RECOVERY] Rebuilt {len(metadata)} files from {len(inventories)} nodes")
+    return {
+        "files": len(metadata),
+        "chunks": sum(len(r["chunks"]) for r in metadata.values()),
+        "nodes_scanned": sorted(inventories),
+        "failed_nodes": failed,
+        "merged": merged,
+        "unowned_chunks": len(unowned),
+        "seconds": round(time.time() - started, 3),
+    }
+
+@app.post("/reconcile", dependencies=[Depends(verify_token)])
+def reconcile_metadata(adopt: bool = False, gc: bool = False, collect_unknown: bool = False):
+    """Compare metadata with node inventories, optionally adopting unknown files
+    and garbage-collecting orphaned chunks. Chunks of unknown files are only
+    collected when collect_unknown is set."""
+    with METADATA_LOCK:
+        inventories, failed = fetch_inventories(sorted(REGISTERED_NODES))
+        metadata = load_metadata()
+        report = reconcile(
+            metadata, inventories, ORPHAN_GRACE_SECONDS, adopt=adopt, collect_unknown=collect_unknown
+        )
 
-    return FileResponse(output_path, filename=filename)
+        # Drop entries for replicas that their node no longer holds
+        missing = {(m["node"], m["chunk"]) for m in report["missing"]}
+        changed = bool(missing or report["reattached"])
+        for record in metadata.values():
+            record["chunks"] = [e for e in record["chunks"] if (e["node"], e["chunk"]) not in missing]
+        # Replicas of current uploads that metadata lost track of
+        for item in report["reattached"]:
+            record = metadata[item["file"]]
+            record["chunks"].append({
+                "chunk": item["chunk"], "index": item["index"],
+                "node": item["node"], "checksum": item["checksum"],
+            })
+            record["chunks"].sort(key=lambda e: (e["index"], e["node"]))
+        if adopt and report["unknown_files"]:
+            metadata.update(report["unknown_files"])
+            changed = True
+        if changed:
+            save_metadata(metadata)
+        invalidate_file_index()
+
+    collected = delete_chunks(report["orphans"]) if gc else 0
+    return {
+        "orphans": report["orphans"],
+        "missing": report["missing"],
+        "reattached": report["reattached"],
+        "unknown_files": sorted(report["unknown_files"]),
+        "adopted": adopt,
+        "collected": collected,
+        "failed_nodes": failed,
+    }
+
+@app.on_event("startup")
+def recover_on_startup():
+    # Metadata lost or unreadable: rebuild it from the nodes we know about
+    try:
+        if os.path.exists(METADATA_FILE):
+            load_metadata()
+            return
+    except ValueError:
+        corrupt = f"{METADATA_FILE}.corrupt-{int(time.time())}"
+        os.replace(METADATA_FILE, corrupt)
+        print(f"[RECOVERY] Metadata unreadable, moved to {corrupt}")
+    if REGISTERED_NODES:
+        recover_metadata(nodes=[])
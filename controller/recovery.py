@@ -0,0 +1,167 @@
+"""
+Rebuild and reconcile controller metadata from node chunk inventories.
+
+Each node keeps a manifest per chunk (owning file, chunk index, checksum and
+the file's chunking parameters). Those manifests are enough to reconstruct
+metadata records if the controller's copy is lost.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def fetch_inventories(nodes, timeout=30, max_workers=32):
+    """Fetch /inventory from every node in parallel; returns (inventories, failed)"""
+    def fetch(node):
+        try:
+            res = requests.get(f"{node}/inventory", timeout=timeout)
+            res.raise_for_status()
+            return node, res.json()["chunks"]
+        except Exception as e:
+            print(f"[RECOVERY] Could not read inventory from {node}: {e}")
+            return node, None
+
+    inventories, failed = {}, []
+    if not nodes:
+        return inventories, failed
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(nodes))) as pool:
+        for node, chunks in pool.map(fetch, nodes):
+            if chunks is None:
+                failed.append(node)
+            else:
+                inventories[node] = chunks
+    return inventories, failed
+
+
+def rebuild_metadata(inventories):
+    """Build metadata records from manifests; returns (metadata, unowned)
+
+    When a file was uploaded more than once, only chunks from the latest
+    upload are kept. Everything else is returned as unowned (node, manifest) pairs.
+    """
+    latest = {}
+    for manifests in inventories.values():
+        for m in manifests:
+            if m.get("file") is not None:
+                latest[m["file"]] = max(latest.get(m["file"], 0), m.get("uploaded_at") or 0)
+
+    metadata, unowned = {}, []
+    for node, manifests in inventories.items():
+        for m in manifests:
+            owner = m.get("file")
+            if owner is None or (m.get("uploaded_at") or 0) != latest[owner]:
+                unowned.append((node, m))
+                continue
+            record = metadata.setdefault(owner, {
+                "size": m.get("file_size"),
+                "chunk_size": m.get("chunk_size"),
+                "chunk_count": m.get("chunk_count"),
+                "uploaded_at": m.get("uploaded_at"),
+                "chunks": [],
+            })
+            record["chunks"].append({
+                "chunk": m["chunk"], "index": m["index"], "node": node,
+                "checksum": m.get("checksum"),
+            })
+
+    for record in metadata.values():
+        record["chunks"].sort(key=lambda e: (e["index"], e["node"]))
+        if record["chunk_count"] is None:
+            record["chunk_count"] = len({e["index"] for e in record["chunks"]})
+    return metadata, unowned
+
+
+def merge_metadata(existing, rebuilt):
+    """Merge rebuilt records into existing metadata without dropping anything.
+
+    Used when some nodes could not be scanned: their replicas are absent from
+    the rebuilt records, so existing entries are kept and only extended. A
+    rebuilt record replaces an existing one only if it is from a newer upload.
+    """
+    merged = dict(existing)
+    for name, record in rebuilt.items():
+        current = merged.get(name)
+        if current is None or (record.get("uploaded_at") or 0) > (current.get("uploaded_at") or 0):
+            merged[name] = record
+        elif record.get("uploaded_at") == current.get("uploaded_at"):
+            known = {(e["node"], e["chunk"]) for e in current["chunks"]}
+            current["chunks"].extend(
+                e for e in record["chunks"] if (e["node"], e["chunk"]) not in known
+            )
+            current["chunks"].sort(key=lambda e: (e["index"], e["node"]))
+    return merged
+
+
+def reconcile(metadata, inventories, grace_seconds=3600, adopt=False, now=None,
+              collect_unknown=False):
+    """Compare metadata with node inventories.
+
+    Returns a report with chunks held by nodes but not referenced by metadata
+    (orphans, once older than the grace period so in-flight uploads are not
+    collected), metadata entries missing from the node that should hold them,
+    and files found on nodes that metadata does not know about. Chunks of
+    unknown files are complete uploads metadata has lost, so they only count
+    as orphans when collect_unknown is set (and never when adopting). A
+    referenced replica whose checksum no longer matches is reported both as
+    an orphan and as missing, so its metadata entry is dropped. Unreferenced
+    chunks that belong to the current upload of a known file (same chunk,
+    upload time and checksum) are returned as reattached replicas instead.
+    """
+    now = time.time() if now is None else now
+    rebuilt, _ = rebuild_metadata(inventories)
+    unknown = {name: record for name, record in rebuilt.items() if name not in metadata}
+    kept = set()
+    if adopt or not collect_unknown:
+        kept = {(e["node"], e["chunk"]) for r in unknown.values() for e in r["chunks"]}
+
+    referenced = {}
+    uploads = {}
+    for name, record in metadata.items():
+        for entry in record["chunks"]:
+            referenced[(entry["node"], entry["chunk"])] = (name, entry)
+            uploads.setdefault((name, entry["chunk"]), entry)
+
+    def current_upload(m):
+        entry = uploads.get((m.get("file"), m["chunk"]))
+        if entry is None or entry["index"] != m.get("index"):
+            return None
+        uploaded_at = metadata[m["file"]].get("uploaded_at")
+        if uploaded_at is not None and uploaded_at != m.get("uploaded_at"):
+            return None
+        if entry.get("checksum") not in (None, m.get("checksum")):
+            return None
+        return entry
+
+    held = set()
+    orphans = []
+    reattached = []
+    stale_keys = set()
+    for node, manifests in inventories.items():
+        for m in manifests:
+            key = (node, m["chunk"])
+            held.add(key)
+            owner = referenced.get(key)
+            stale = owner is not None and owner[1].get("checksum") not in (None, m.get("checksum"))
+            if stale:
+                stale_keys.add(key)
+            if (owner is not None and not stale) or key in kept:
+                continue
+            entry = None if owner is not None else current_upload(m)
+            if entry is not None:
+                reattached.append({
+                    "node": node, "chunk": m["chunk"], "file": m["file"],
+                    "index": entry["index"], "checksum": entry.get("checksum"),
+                })
+            elif now - (m.get("stored_at") or 0) >= grace_seconds:
+                orphans.append({"node": node, "chunk": m["chunk"], "file": m.get("file")})
+
+    missing = [
+        {"node": node, "chunk": chunk, "file": name}
+        for (node, chunk), (name, _) in referenced.items()
+        if node in inventories and ((node, chunk) not in held or (node, chunk) in stale_keys)
+    ]
+    return {
+        "orphans": orphans, "missing": missing, "unknown_files": unknown,
+        "reattached": reattached,
+    }
@@ -0,0 +1,170 @@
+"""
+Per-tenant rate limiting and fair scheduling of chunk transfers.
+
+Every chunk transfer to or from a storage node goes through that node's
+queue. Queues are ordered by self-clocked weighted fair queueing, where each
+request is a flow weighted by its tenant. Small requests therefore interleave
+with bulk ones instead of waiting behind them. Tenants are additionally shaped
+by a token bucket measured in bytes.
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+
+class TokenBucket:
+    """Byte token bucket that may go into debt.
+
+    reserve() always succeeds and returns how long the caller should wait
+    before sending, so a large transfer is paced rather than rejected.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def full(self):
+        """True once the bucket has refilled, i.e. it behaves like a new one"""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill()
+            return self.tokens >= self.burst
+
+    def delay(self):
+        """Seconds until the bucket is out of debt"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill()
+            return max(0.0, -self.tokens / self.rate)
+
+    def reserve(self, amount):
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+
+class NodeQueue:
+    """Weighted fair queue of transfers to one node, drained by worker threads"""
+
+    def __init__(self, node, workers=4, max_pending=256, flow_window=8):
+        self.node = node
+        self.max_pending = max_pending
+        self.flow_window = flow_window
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._vtime = 0.0
+        self._finish = {}
+        self._pending = {}
+        self.pending = 0
+        for i in range(workers):
+            threading.Thread(
+                target=self._work, name=f"transfer-{node}-{i}", daemon=True
+            ).start()
+
+    @property
+    def saturated(self):
+        return self.pending >= self.max_pending
+
+    def submit(self, flow, weight, size, fn, *args):
+        """Queue fn(*args); blocks while this flow already has flow_window transfers queued"""
+        future = Future()
+        with self._cond:
+            while self._pending.get(flow, 0) >= self.flow_window:
+                self._cond.wait()
+            tag = max(self._vtime, self._finish.get(flow, 0.0)) + max(size, 1) / weight
+            self._finish[flow] = tag
+            self._pending[flow] = self._pending.get(flow, 0) + 1
+            self.pending += 1
+            heapq.heappush(self._heap, (tag, next(self._seq), flow, future, fn, args))
+            self._cond.notify_all()
+        return future
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                tag, _, flow, future, fn, args = heapq.heappop(self._heap)
+                self._vtime = tag
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            with self._cond:
+                self.pending -= 1
+                self._pending[flow] -= 1
+                if not self._pending[flow]:
+                    # Idle flows restart from the current virtual time
+                    del self._pending[flow]
+                    del self._finish[flow]
+                self._cond.notify_all()
+
+
+class TransferScheduler:
+    def __init__(self, default_rate=0, default_burst=0, tenants=None,
+                 workers_per_node=4, max_pending_per_node=256, flow_window=8,
+                 sweep_interval=60):
+        self.default_rate = default_rate
+        self.default_burst = default_burst or default_rate
+        self.tenants = tenants or {}
+        self.workers_per_node = workers_per_node
+        self.max_pending_per_node = max_pending_per_node
+        self.flow_window = flow_window
+        self.sweep_interval = sweep_interval
+        self._queues = {}
+        self._buckets = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def queue(self, node):
+        with self._lock:
+            if node not in self._queues:
+                self._queues[node] = NodeQueue(
+                    node, self.workers_per_node, self.max_pending_per_node, self.flow_window
+                )
+            return self._queues[node]
+
+    def bucket(self, tenant):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._swept >= self.sweep_interval:
+                # Full buckets are indistinguishable from new ones, so drop
+                # them rather than keep one per tenant ever seen
+                self._buckets = {t: b for t, b in self._buckets.items() if not b.full()}
+                self._swept = now
+            if tenant not in self._buckets:
+                limits = self.tenants.get(tenant, {})
+                rate = limits.get("rate", self.default_rate)
+                burst = limits.get("burst", self.default_burst if rate == self.default_rate else rate)
+                self._buckets[tenant] = TokenBucket(rate, burst)
+            return self._buckets[tenant]
+
+    def weight(self, tenant):
+        return self.tenants.get(tenant, {}).get("weight", 1)
+
+    def saturated(self, node):
+        queue = self._queues.get(node)
+        return queue is not None and queue.saturated
+
+    def submit(self, tenant, flow, node, size, fn, *args):
+        """Pace the tenant, then queue a transfer of size bytes to node"""
+        wait = self.bucket(tenant).reserve(size)
+        if wait:
+            time.sleep(wait)
+        return self.queue(node).submit(flow, self.weight(tenant), size, fn, *args)
@@ -1,23 +1,78 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header
 from fastapi.responses import FileResponse
+from typing import Optional
+import hashlib
+import json
 import os
 import requests
+import threading
 import time
 
+from utils.metrics import Registry, SamplingProfiler, instrument_app
+
 app = FastAPI()
 
+# Same key as the controller; guards the profiler, whose output exposes stacks and paths
+API_KEY = os.getenv("API_KEY", "supersecret")
+
+def verify_token(x_api_key: str = Header(...)):
+    if x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+# Metrics exposed on /metrics, profiler toggled via /debug/profiler
+METRICS = Registry()
+PROFILER = SamplingProfiler()
+instrument_app(app, METRICS, PROFILER, dependencies=[Depends(verify_token)])
+
+CHUNK_REQUESTS = METRICS.counter(
+    "node_chunk_requests_total", "Chunk operations handled by this node", ("op",)
+)
+CHUNK_ERRORS = METRICS.counter(
+    "node_chunk_errors_total", "Chunk operations that failed on this node", ("op",)
+)
+CHUNK_BYTES = METRICS.counter(
+    "node_chunk_bytes_total", "Chunk bytes written to or read from disk", ("direction",)
+)
+
 # Environment configs
 NODE_PORT = os.getenv("NODE_PORT", "9003")
 CONTROLLER_URL = os.getenv("CONTROLLER_URL", "http://localhost:8000")
+REGISTER_INTERVAL = int(os.getenv("REGISTER_INTERVAL", "30"))
 STORAGE_PATH = "storage/"
-os.makedirs(STORAGE_PATH, exist_ok=True)
+# Sidecar manifests (owning file, chunk index, checksum) used by the
+# controller to rebuild its metadata from node inventories
+MANIFEST_PATH = os.path.join(STORAGE_PATH, ".manifests")
+os.makedirs(MANIFEST_PATH, exist_ok=True)
+
+# chunk name -> manifest, kept in memory so /inventory never walks the disk
+INVENTORY = {}
+
+def load_inventory():
+    INVENTORY.clear()
+    for name in os.listdir(STORAGE_PATH):
+        path = os.path.join(STORAGE_PATH, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(os.path.join(MANIFEST_PATH, f"{name}.json")) as f:
+                INVENTORY[name] = json.load(f)
+        except (OSError, ValueError):
+            # Chunks stored before manifests existed have no known owner
+            INVENTORY[name] = {"chunk": name, "file": None, "size": os.path.getsize(path),
+                               "stored_at": os.path.getmtime(path)}
+
+def write_manifest(manifest):
+    path = os.path.join(MANIFEST_PATH, f"{manifest['chunk']}.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{path}.tmp", path)
 
 # Register with the controller on startup
-def register_with_controller():
+def register_with_controller(attempts=5):
     hostname = os.getenv("HOSTNAME", "node3")
     node_url = f"http://{hostname}:{NODE_PORT}"
     
-    for _ in range(5):
+    for _ in range(attempts):
         try:
             res = requests.post(
                 f"{CONTROLLER_URL}/register",
@@ -25,29 +80,59 @@ def register_with_controller():
             )
             if res.status_code == 200:
                 print(f"[AUTO-REGISTER] Registered as {node_url}")
-                return
+                return True
         except Exception as e:
             print(f"[ERROR] Could not register with controller: {e}")
         time.sleep(2)
+    return False
+
+# Keep re-registering so a restarted controller relearns this node
+def heartbeat():
+    while True:
+        time.sleep(REGISTER_INTERVAL)
+        register_with_controller(attempts=1)
 
 
 @app.on_event("startup")
 def startup_event():
+    load_inventory()
     register_with_controller()
+    threading.Thread(target=heartbeat, daemon=True).start()
 
 # Endpoint to store a chunk
 @app.post("/store_chunk")
-async def store_chunk(filename: str, file: UploadFile = File(...)):
+async def store_chunk(filename: str, file: UploadFile = File(...),
+                      owner: Optional[str] = None, index: Optional[int] = None,
+                      checksum: Optional[str] = None, uploaded_at: Optional[float] = None,
+                      file_size: Optional[int] = None, chunk_size: Optional[int] = None,
+                      chunk_count: Optional[int] = None):
+    CHUNK_REQUESTS.inc(op="store")
+    data = await file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if checksum is not None and checksum != digest:
+        CHUNK_ERRORS.inc(op="store")
+        raise HTTPException(status_code=400, detail="Checksum mismatch")
     with open(os.path.join(STORAGE_PATH, filename), "wb") as f:
-        f.write(await file.read())
+        f.write(data)
+    manifest = {
+        "chunk": filename, "file": owner, "index": index, "checksum": digest,
+        "size": len(data), "uploaded_at": uploaded_at, "stored_at": time.time(),
+        "file_size": file_size, "chunk_size": chunk_size, "chunk_count": chunk_count,
+    }
+    write_manifest(manifest)
+    INVENTORY[filename] = manifest
+    CHUNK_BYTES.inc(len(data), direction="stored")
     return {"status": "stored"}
 
 # Endpoint to retrieve a chunk
 @app.get("/get_chunk/{filename}")
 def get_chunk(filename: str):
+    CHUNK_REQUESTS.inc(op="get")
     path = os.path.join(STORAGE_PATH, filename)
     if os.path.exists(path):
+        CHUNK_BYTES.inc(os.path.getsize(path), direction="served")
         return FileResponse(path, filename=filename)
+    CHUNK_ERRORS.inc(op="get")
     return {"error": "not found"}
 
 # Health check
@@ -55,11 +140,22 @@ def get_chunk(filename: str):
 def health():
     return {"status": "ok"}
 
+# Manifests of every chunk held by this node
+@app.get("/inventory")
+def inventory():
+    return {"chunks": list(INVENTORY.values())}
+
 
 @app.delete("/delete_chunk/{filename}")
 def delete_chunk(filename: str):
+    CHUNK_REQUESTS.inc(op="delete")
     path = os.path.join(STORAGE_PATH, filename)
     if os.path.exists(path):
         os.remove(path)
+        INVENTORY.pop(filename, None)
+        manifest = os.path.join(MANIFEST_PATH, f"{filename}.json")
+        if os.path.exists(manifest):
+            os.remove(manifest)
         return {"status": "deleted"}
+    CHUNK_ERRORS.inc(op="delete")
     return {"error": "chunk not found"}
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Self-contained cluster benchmark for the distributed file storage system.
+
+Starts the controller plus N stand-in storage nodes on localhost ports, sweeps
+file size, chunk size, replication factor and concurrency, and writes the
+measured throughput and latency as JSON. Pass --baseline to compare against a
+previous run and fail on regressions.
+
+Example:
+    python scripts/benchmark_cluster.py --file-sizes 1MB,16MB --concurrency 1,8 \\
+        --output bench.json --baseline bench-baseline.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+import uvicorn
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "B": 1}
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {
+    "upload_mbps": True,
+    "download_mbps": True,
+    "upload_p50_ms": False,
+    "upload_p99_ms": False,
+    "download_p50_ms": False,
+    "download_p99_ms": False,
+}
+
+
+def parse_size(value):
+    """Parse sizes such as '512KB' or '4MB' into bytes; 'auto' means adaptive (0)"""
+    value = value.strip().upper()
+    if value == "AUTO":
+        return 0
+    for unit, factor in SIZE_UNITS.items():
+        if value.endswith(unit):
+            return int(float(value[: -len(unit)]) * factor)
+    return int(value)
+
+
+def parse_list(value, cast=int):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; returns None for an empty sample"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def create_standin_node(latency_ms=0.0, failure_rate=0.0):
+    """Storage node stand-in that keeps chunks in memory.
+
+    Mirrors the node chunk API and can inject per-request latency and
+    random 500 responses to simulate slow or flaky nodes.
+    """
+    app = FastAPI()
+    chunks = {}
+    manifests = {}
+
+    def disturb():
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        if failure_rate and random.random() < failure_rate:
+            raise HTTPException(status_code=500, detail="Injected failure")
+
+    @app.post("/store_chunk")
+    async def store_chunk(request: Request, filename: str, file: UploadFile = File(...)):
+        disturb()
+        chunks[filename] = await file.read()
+        manifest = {k: v for k, v in request.query_params.items() if k != "filename"}
+        manifests[filename] = {
+            "chunk": filename,
+            "file": manifest.get("owner"),
+            "index": int(manifest["index"]) if "index" in manifest else None,
+            "checksum": manifest.get("checksum"),
+            "uploaded_at": float(manifest.get("uploaded_at") or 0),
+            "stored_at": time.time(),
+            "file_size": int(manifest["file_size"]) if "file_size" in manifest else None,
+            "chunk_size": int(manifest["chunk_size"]) if "chunk_size" in manifest else None,
+            "chunk_count": int(manifest["chunk_count"]) if "chunk_count" in manifest else None,
+        }
+        return {"status": "stored"}
+
+    @app.get("/get_chunk/{filename}")
+    def get_chunk(filename: str):
+        disturb()
+        if filename not in chunks:
+            return {"error": "not found"}
+        return Response(chunks[filename], media_type="application/octet-stream")
+
+    @app.delete("/delete_chunk/{filename}")
+    def delete_chunk(filename: str):
+        manifests.pop(filename, None)
+        if chunks.pop(filename, None) is None:
+            return {"error": "chunk not found"}
+        return {"status": "deleted"}
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/inventory")
+    def inventory():
+        return {"chunks": list(manifests.values())}
+
+    app.state.chunks = chunks
+    app.state.manifests = manifests
+    return app
+
+
+class ThreadedServer:
+    """Runs an ASGI app with uvicorn on a background thread"""
+
+    def __init__(self, app, port=None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError(f"Server on port {self.port} failed to start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+class InProcessController:
+    """Controller imported into this process; settings are patched per run"""
+
+    def __init__(self, workdir):
+        sys.path.insert(0, str(REPO_ROOT))
+        from controller import main
+
+        self.module = main
+        self.workdir = workdir
+        self.original_cwd = os.getcwd()
+        self.original_settings = {
+            name: getattr(main, name)
+            for name in ("METADATA_FILE", "CHUNK_SIZE", "REPLICATION_FACTOR")
+        }
+        self.server = None
+        self.url = None
+
+    def start(self, chunk_size, replication):
+        self.module.METADATA_FILE = os.path.join(self.workdir, "metadata.json")
+        self.module.CHUNK_SIZE = chunk_size
+        self.module.REPLICATION_FACTOR = replication
+        self.module.REGISTERED_NODES.clear()
+        if self.server is None:
+            os.chdir(self.workdir)
+            self.server = ThreadedServer(self.module.app).start()
+            self.url = self.server.url
+
+    def peak_rss_mb(self):
+        # Includes the stand-in nodes and client, since they share the process
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(usage / 1024 if sys.platform != "darwin" else usage / 1024 ** 2, 1)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+            os.chdir(self.original_cwd)
+        for name, value in self.original_settings.items():
+            setattr(self.module, name, value)
+        self.module.REGISTERED_NODES.clear()
+
+
+class SubprocessController:
+    """Controller run under uvicorn in a child process, restarted per run"""
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.process = None
+        self.url = None
+
+    def start(self, chunk_size, replication):
+        self.stop()
+        port = free_port()
+        env = dict(
+            os.environ,
+            PYTHONPATH=str(REPO_ROOT),
+            METADATA_FILE=os.path.join(self.workdir, "metadata.json"),
+            CHUNK_SIZE=str(chunk_size),
+            REPLICATION_FACTOR=str(replication),
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "controller.main:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=self.workdir,
+            env=env,
+        )
+        self.url = f"http://127.0.0.1:{port}"
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        raise RuntimeError("Controller did not become healthy within 30s")
+
+    def peak_rss_mb(self):
+        # VmHWM is the resident set high-water mark of the controller process
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+        return None
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+            self.process = None
+
+
+def run_ops(func, items, concurrency):
+    """Run func over items with the given concurrency; returns (latencies, errors, seconds)"""
+    latencies, errors = [], 0
+
+    def timed(item):
+        start = time.perf_counter()
+        ok = func(item)
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, elapsed in pool.map(timed, items):
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+    return latencies, errors, time.perf_counter() - start
+
+
+def benchmark_config(controller_url, file_size, concurrency, files_per_run):
+    payload = os.urandom(file_size)
+    names = [f"bench_{uuid.uuid4().hex[:12]}.bin" for _ in range(files_per_run)]
+
+    def upload(name):
+        res = requests.post(f"{controller_url}/upload", files={"file": (name, payload)})
+        return res.status_code == 200 and "error" not in res.json()
+
+    def download(name):
+        res = requests.get(f"{controller_url}/download/{name}")
+        return res.status_code == 200 and res.content == payload
+
+    up_lat, up_err, up_secs = run_ops(upload, names, concurrency)
+    down_lat, down_err, down_secs = run_ops(download, names, concurrency)
+    for name in names:
+        requests.delete(f"{controller_url}/delete/{name}")
+
+    def mbps(latencies, seconds):
+        return round(len(latencies) * file_size / 1024 ** 2 / seconds, 2) if seconds else 0.0
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "upload_mbps": mbps(up_lat, up_secs),
+        "download_mbps": mbps(down_lat, down_secs),
+        "upload_p50_ms": ms(percentile(up_lat, 50)),
+        "upload_p99_ms": ms(percentile(up_lat, 99)),
+        "download_p50_ms": ms(percentile(down_lat, 50)),
+        "download_p99_ms": ms(percentile(down_lat, 99)),
+        "upload_errors": up_err,
+        "download_errors": down_err,
+    }
+
+
+def config_key(result):
+    return (result["file_size"], result["chunk_size"], result["replication"], result["concurrency"])
+
+
+def compare_results(current, baseline, tolerance):
+    """Return a list of regression messages for metrics worse than tolerance"""
+    previous = {config_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(config_key(result))
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(
+                    f"{metric} {old_value} -> {new_value} ({change:+.1%}) for "
+                    f"file_size={result['file_size']} chunk_size={result['chunk_size']} "
+                    f"replication={result['replication']} concurrency={result['concurrency']}"
+                )
+    return regressions
+
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="dfs-bench-")
+    nodes = [
+        ThreadedServer(create_standin_node(args.node_latency_ms, args.node_failure_rate)).start()
+        for _ in range(args.nodes)
+    ]
+    controller_cls = InProcessController if args.controller == "inprocess" else SubprocessController
+    controller = controller_cls(workdir)
+    results = []
+    try:
+        for chunk_size, replication in itertools.product(args.chunk_sizes, args.replication):
+            if replication > args.nodes:
+                print(f"Skipping replication={replication}: only {args.nodes} nodes")
+                continue
+            controller.start(chunk_size, replication)
+            for node in nodes:
+                requests.post(f"{controller.url}/register", json={"node_url": node.url})
+            for file_size, concurrency in itertools.product(args.file_sizes, args.concurrency):
+                files_per_run = args.files or max(4, concurrency * 2)
+                result = {
+                    "file_size": file_size,
+                    "chunk_size": chunk_size,
+                    "replication": replication,
+                    "concurrency": concurrency,
+                    "nodes": args.nodes,
+                    "files": files_per_run,
+                }
+                result.update(benchmark_config(controller.url, file_size, concurrency, files_per_run))
+                result["controller_peak_rss_mb"] = controller.peak_rss_mb()
+                print(json.dumps(result))
+                results.append(result)
+    finally:
+        controller.stop()
+        for node in nodes:
+            node.stop()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "controller": args.controller,
+            "node_latency_ms": args.node_latency_ms,
+            "node_failure_rate": args.node_failure_rate,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3, help="number of stand-in storage nodes")
+    parser.add_argument("--file-sizes", type=lambda v: parse_list(v, parse_size), default="1MB,8MB")
+    parser.add_argument(
+        "--chunk-sizes", type=lambda v: parse_list(v, parse_size), default="auto",
+        help="fixed chunk sizes to sweep, or 'auto' for the adaptive policy",
+    )
+    parser.add_argument("--replication", type=parse_list, default="2")
+    parser.add_argument("--concurrency", type=parse_list, default="1,4")
+    parser.add_argument("--files", type=int, default=0, help="files per run (default: 2x concurrency, min 4)")
+    parser.add_argument("--node-latency-ms", type=float, default=0.0, help="latency injected into every node request")
+    parser.add_argument("--node-failure-rate", type=float, default=0.0, help="fraction of node requests that fail")
+    parser.add_argument("--controller", choices=["subprocess", "inprocess"], default="subprocess")
+    parser.add_argument("--output", help="write results JSON to this path")
+    parser.add_argument("--baseline", help="compare against a previous results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run_benchmark(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
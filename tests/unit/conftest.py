@@ -0,0 +1,27 @@
+"""
+Shared fixtures for unit tests that drive the controller against stand-in nodes
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    """Controller app wired to two in-memory stand-in nodes; yields (main, client, nodes)"""
+    from controller import main
+    from scripts.benchmark_cluster import ThreadedServer, create_standin_node
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "METADATA_FILE", str(tmp_path / "metadata.json"))
+    monkeypatch.setattr(main, "CHUNK_SIZE", 1000)
+    monkeypatch.setattr(main, "ORPHAN_GRACE_SECONDS", 0)
+    nodes = [ThreadedServer(create_standin_node()).start() for _ in range(2)]
+    main.REGISTERED_NODES.clear()
+    main.REGISTERED_NODES.update(node.url for node in nodes)
+    try:
+        yield main, TestClient(main.app), nodes
+    finally:
+        main.REGISTERED_NODES.clear()
+        main.invalidate_file_index()
+        for node in nodes:
+            node.stop()
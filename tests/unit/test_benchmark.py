@@ -0,0 +1,49 @@
+"""
+Unit tests for the cluster benchmark harness
+"""
+import pytest
+
+from scripts.benchmark_cluster import compare_results, main, parse_size, percentile
+
+
+def _report(**metrics):
+    result = {"file_size": 1024, "chunk_size": 512, "replication": 2, "concurrency": 1}
+    result.update(metrics)
+    return {"results": [result]}
+
+
+class TestBenchmarkHelpers:
+    """Test parsing, percentiles and baseline comparison"""
+
+    def test_parse_size(self):
+        assert parse_size("512KB") == 512 * 1024
+        assert parse_size("4mb") == 4 * 1024 * 1024
+        assert parse_size("100") == 100
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 50) is None
+
+    def test_compare_flags_throughput_and_latency_regressions(self):
+        baseline = _report(upload_mbps=100.0, upload_p99_ms=10.0)
+
+        assert compare_results(_report(upload_mbps=95.0, upload_p99_ms=10.5), baseline, 0.1) == []
+
+        regressions = compare_results(_report(upload_mbps=50.0, upload_p99_ms=20.0), baseline, 0.1)
+        assert len(regressions) == 2
+
+
+@pytest.mark.slow
+class TestBenchmarkRun:
+    """Run a tiny sweep against the in-process controller"""
+
+    def test_inprocess_run(self, tmp_path):
+        output = tmp_path / "bench.json"
+        args = [
+            "--controller", "inprocess", "--nodes", "2", "--file-sizes", "64KB",
+            "--chunk-sizes", "16KB", "--concurrency", "2", "--output", str(output),
+        ]
+        assert main(args) == 0
+        assert main(args + ["--baseline", str(output), "--tolerance", "100"]) == 0
@@ -0,0 +1,130 @@
+"""
+Unit tests for adaptive chunk sizing and range reads
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.file_utils import assemble_file, choose_chunk_size, chunk_span
+
+MB = 1024 * 1024
+
+
+class TestChunkPolicy:
+    """Test chunk size selection and assembly"""
+
+    def test_small_files_use_minimum_chunk(self):
+        assert choose_chunk_size(1024) == MB
+        assert choose_chunk_size(0) == MB
+
+    def test_chunk_count_is_bounded(self):
+        size = choose_chunk_size(1024 * MB)
+        assert size == 16 * MB
+        assert -(-1024 * MB // size) <= 64
+
+    def test_huge_files_use_maximum_chunk(self):
+        assert choose_chunk_size(100 * 1024 * MB) == 64 * MB
+
+    def test_chunk_span(self):
+        assert chunk_span(0, 99, 100) == (0, 0)
+        assert chunk_span(150, 250, 100) == (1, 2)
+
+    def test_assemble_orders_by_index_and_checks_size(self):
+        assert assemble_file([(1, b"cd"), (0, b"ab"), (2, b"e")], 2) == b"abcde"
+        with pytest.raises(ValueError):
+            assemble_file([(0, b"a"), (1, b"cd")], 2)
+
+
+class TestRangeDownload:
+    """Test that range reads only use the chunks they need"""
+
+    def test_chunk_size_recorded_and_range_served(self, cluster):
+        _, controller, _ = cluster
+        payload = os.urandom(3500)
+        res = controller.post("/upload", files={"file": ("data.bin", payload)})
+        assert res.json()["chunk_size"] == 1000
+
+        full = controller.get("/download/data.bin")
+        assert full.content == payload
+
+        part = controller.get("/download/data.bin", headers={"Range": "bytes=900-2100"})
+        assert part.status_code == 206
+        assert part.content == payload[900:2101]
+        assert part.headers["content-range"] == "bytes 900-2100/3500"
+
+        tail = controller.get("/download/data.bin", headers={"Range": "bytes=-100"})
+        assert tail.content == payload[-100:]
+
+        bad = controller.get("/download/data.bin", headers={"Range": "bytes=4000-"})
+        assert bad.status_code == 416
+
+    def test_download_fails_over_from_bad_replica(self, cluster):
+        main, client, nodes = cluster
+        payload = os.urandom(2500)
+        client.post("/upload", files={"file": ("data.bin", payload)})
+        first = main.load_metadata()["data.bin"]["chunks"][0]
+        stored = {n.url: n.server.config.app.state.chunks for n in nodes}
+
+        # A missing chunk comes back as a 200 error body, a corrupt one with the right length
+        del stored[first["node"]][first["chunk"]]
+        assert client.get("/download/data.bin").content == payload
+        for chunks in stored.values():
+            if first["chunk"] in chunks:
+                chunks[first["chunk"]] = bytes(len(chunks[first["chunk"]]))
+
+        res = client.get("/download/data.bin")
+        assert res.status_code == 200
+        assert "failed verification" in res.json()["error"]
+
+
+class TestFailedUpload:
+    """Test that a failed upload keeps the previous version of a file"""
+
+    def test_failed_upload_keeps_previous_version(self, cluster, monkeypatch):
+        main, client, nodes = cluster
+        payload = os.urandom(2500)
+        client.post("/upload", files={"file": ("f.bin", payload)})
+        before = main.load_metadata()["f.bin"]
+
+        monkeypatch.setattr(main, "send_chunk_to_node", lambda *args: False)
+        res = client.post("/upload", files={"file": ("f.bin", os.urandom(2500))})
+
+        assert res.status_code == 502
+        assert main.load_metadata()["f.bin"] == before
+        assert client.get("/download/f.bin").content == payload
+
+    def test_partial_upload_removes_stored_chunks(self, cluster, monkeypatch):
+        main, client, nodes = cluster
+        store = main.send_chunk_to_node
+        monkeypatch.setattr(
+            main, "send_chunk_to_node",
+            lambda node, name, data, manifest: manifest["index"] != 1 and store(node, name, data, manifest),
+        )
+        res = client.post("/upload", files={"file": ("f.bin", os.urandom(2500))})
+
+        assert res.status_code == 502
+        assert "f.bin" not in main.load_metadata()
+        assert all(not node.server.config.app.state.chunks for node in nodes)
+
+
+class TestConcurrentUpload:
+    """Test that uploads of the same name do not share temp files or chunks"""
+
+    def test_same_name_uploads_do_not_collide(self, cluster):
+        main, client, nodes = cluster
+        payloads = [os.urandom(2500) for _ in range(12)]
+
+        def upload(payload):
+            return client.post("/upload", files={"file": ("same.bin", payload)}).status_code
+
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            statuses = list(pool.map(upload, payloads))
+
+        assert statuses == [200] * len(payloads)
+        assert client.get("/download/same.bin").content in payloads
+        # Only the winning upload's chunks stay on the nodes
+        record = main.load_metadata()["same.bin"]
+        stored = sorted(name for node in nodes for name in node.server.config.app.state.chunks)
+        assert stored == sorted(e["chunk"] for e in record["chunks"])
+        assert os.listdir(".") == ["metadata.json"]
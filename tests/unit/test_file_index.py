@@ -0,0 +1,96 @@
+"""
+Unit tests for the controller file index
+"""
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from controller.file_index import FileIndex
+
+
+def _record(size, chunk_size, placements):
+    chunk_count = -(-size // chunk_size)
+    chunks = [
+        {"chunk": f"c{index}", "index": index, "node": node}
+        for index, nodes in placements.items()
+        for node in nodes
+    ]
+    return {"size": size, "chunk_size": chunk_size, "chunk_count": chunk_count, "chunks": chunks}
+
+
+class TestFileIndex:
+    """Test pagination and incrementally maintained aggregates"""
+
+    def test_cursor_pagination_with_prefix(self):
+        metadata = {name: _record(10, 10, {0: ["n1", "n2"]}) for name in
+                    ["a1", "a2", "a3", "b1", "b2"]}
+        index = FileIndex.build(metadata, replication_factor=2)
+
+        names, cursor, total = index.page(prefix="a", limit=2)
+        assert names == ["a1", "a2"] and total == 3
+        names, cursor, _ = index.page(prefix="a", cursor=cursor, limit=2)
+        assert names == ["a3"] and cursor is None
+
+        names, cursor, total = index.page(limit=10)
+        assert len(names) == 5 and cursor is None and total == 5
+
+    def test_aggregates_follow_put_and_remove(self):
+        index = FileIndex(replication_factor=2)
+        index.put("x", _record(25, 10, {0: ["n1", "n2"], 1: ["n1", "n2"], 2: ["n1"]}))
+        summary = index.summary()
+        assert summary["bytes"] == 25
+        assert summary["chunks"] == 3
+        assert summary["under_replicated_chunks"] == 1
+        assert summary["nodes"]["n1"] == {"chunks": 3, "bytes": 25}
+        assert summary["nodes"]["n2"] == {"chunks": 2, "bytes": 20}
+
+        index.put("x", _record(5, 10, {0: ["n2", "n3"]}))
+        summary = index.summary()
+        assert summary["bytes"] == 5 and summary["under_replicated_chunks"] == 0
+        assert "n1" not in summary["nodes"]
+
+        index.remove("x")
+        assert index.summary() == {
+            "files": 0, "bytes": 0, "chunks": 0, "under_replicated_chunks": 0, "nodes": {}
+        }
+
+
+class TestListingLock:
+    """Test that listing does not wait on the metadata lock once the index exists"""
+
+    def test_files_served_while_metadata_lock_held(self, cluster):
+        main, client, _ = cluster
+        client.post("/upload", files={"file": ("a.bin", b"x" * 10)})
+        main.file_index()
+
+        held, release = threading.Event(), threading.Event()
+
+        def hold():
+            with main.METADATA_LOCK:
+                held.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait(5)
+        try:
+            started = time.monotonic()
+            assert client.get("/files").json()["files"] == ["a.bin"]
+            assert time.monotonic() - started < 2
+        finally:
+            release.set()
+            holder.join()
+
+    def test_delete_releases_lock_before_node_requests(self, cluster, monkeypatch):
+        main, client, _ = cluster
+        client.post("/upload", files={"file": ("a.bin", b"x" * 10)})
+        locked = []
+        monkeypatch.setattr(
+            main, "delete_chunks", lambda chunks: locked.append(main.METADATA_LOCK._is_owned())
+        )
+
+        client.delete("/delete/a.bin")
+
+        assert locked == [False]
+        assert client.get("/files").json()["files"] == []
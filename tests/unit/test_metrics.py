@@ -0,0 +1,87 @@
+"""
+Unit tests for the metrics registry and request instrumentation
+"""
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils.metrics import Registry, SamplingProfiler, instrument_app
+
+
+class TestRegistry:
+    """Test Prometheus text rendering"""
+
+    def test_counter_and_gauge_render(self):
+        registry = Registry()
+        sent = registry.counter("bytes_total", "Bytes sent", ("node",))
+        active = registry.gauge("active", "Active transfers")
+
+        sent.inc(10, node="http://node1:9001")
+        sent.inc(5, node="http://node1:9001")
+        with active.track_inprogress():
+            assert active.value() == 1
+        assert active.value() == 0
+
+        output = registry.render()
+        assert "# TYPE bytes_total counter" in output
+        assert 'bytes_total{node="http://node1:9001"} 15' in output
+        assert "# TYPE active gauge" in output
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = registry.histogram("latency", "Latency", ("op",), buckets=(0.1, 1.0))
+
+        latency.observe(0.05, op="store")
+        latency.observe(0.5, op="store")
+        latency.observe(5, op="store")
+
+        output = registry.render()
+        assert 'latency_bucket{op="store",le="0.1"} 1' in output
+        assert 'latency_bucket{op="store",le="1.0"} 2' in output
+        assert 'latency_bucket{op="store",le="+Inf"} 3' in output
+        assert 'latency_count{op="store"} 3' in output
+
+
+class TestInstrumentation:
+    """Test the /metrics and profiler routes added to an app"""
+
+    def test_request_latency_uses_route_template(self):
+        app = FastAPI()
+        registry = Registry()
+        instrument_app(app, registry)
+
+        @app.get("/get_chunk/{filename}")
+        def get_chunk(filename: str):
+            return {"filename": filename}
+
+        client = TestClient(app)
+        client.get("/get_chunk/a_chunk0000.txt")
+        client.get("/get_chunk/a_chunk0001.txt")
+
+        output = client.get("/metrics").text
+        assert (
+            'http_request_duration_seconds_count{method="GET",'
+            'endpoint="/get_chunk/{filename}",status="200"} 2'
+        ) in output
+        assert "a_chunk0000" not in output
+
+    def test_profiler_toggle(self):
+        app = FastAPI()
+        profiler = SamplingProfiler()
+        instrument_app(app, Registry(), profiler)
+        client = TestClient(app)
+
+        assert client.post("/debug/profiler", params={"enabled": True, "interval": 0.001}).json()["running"]
+        time.sleep(0.05)
+        assert not client.post("/debug/profiler", params={"enabled": False}).json()["running"]
+        assert profiler.samples > 0
+
+    def test_profiler_rejects_busy_loop_interval(self):
+        app = FastAPI()
+        profiler = SamplingProfiler()
+        instrument_app(app, Registry(), profiler)
+        client = TestClient(app)
+
+        assert client.post("/debug/profiler", params={"enabled": True, "interval": 0}).status_code == 422
+        assert not profiler.running
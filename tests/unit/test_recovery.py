@@ -0,0 +1,167 @@
+"""
+Unit tests for rebuilding controller metadata from node inventories
+"""
+import os
+
+from controller.recovery import merge_metadata, rebuild_metadata, reconcile
+
+API_HEADERS = {"x-api-key": "supersecret"}
+
+
+def _replicas(record):
+    return sorted((e["index"], e["node"], e["chunk"], e["checksum"]) for e in record["chunks"])
+
+
+def _manifest(chunk, owner, index, uploaded_at=1.0, stored_at=0.0, checksum="c"):
+    return {
+        "chunk": chunk, "file": owner, "index": index, "checksum": checksum,
+        "uploaded_at": uploaded_at, "stored_at": stored_at,
+        "file_size": 20, "chunk_size": 10, "chunk_count": 2,
+    }
+
+
+class TestRebuild:
+    """Test metadata reconstruction and reconciliation"""
+
+    def test_rebuild_keeps_latest_upload(self):
+        inventories = {
+            "n1": [_manifest("a0", "a", 0, uploaded_at=2.0), _manifest("a1", "a", 1, uploaded_at=1.0)],
+            "n2": [_manifest("a1", "a", 1, uploaded_at=2.0), {"chunk": "legacy", "file": None}],
+        }
+        metadata, unowned = rebuild_metadata(inventories)
+
+        assert metadata["a"]["chunk_count"] == 2
+        assert [(e["index"], e["node"]) for e in metadata["a"]["chunks"]] == [(0, "n1"), (1, "n2")]
+        assert sorted(m["chunk"] for _, m in unowned) == ["a1", "legacy"]
+
+    def test_reconcile_reports_orphans_missing_and_unknown(self):
+        metadata = {"a": {"chunks": [
+            {"chunk": "a0", "index": 0, "node": "n1", "checksum": "c"},
+            {"chunk": "a1", "index": 1, "node": "n1", "checksum": "c"},
+        ]}}
+        inventories = {"n1": [
+            _manifest("a0", "a", 0),
+            _manifest("b0", "b", 0, stored_at=100.0),
+            _manifest("c0", "c", 0, stored_at=0.0),
+        ]}
+        report = reconcile(metadata, inventories, grace_seconds=50, now=120.0)
+
+        assert report["orphans"] == []
+        assert report["missing"] == [{"node": "n1", "chunk": "a1", "file": "a"}]
+        assert sorted(report["unknown_files"]) == ["b", "c"]
+
+        collected = reconcile(metadata, inventories, grace_seconds=50, now=120.0, collect_unknown=True)
+        assert [o["chunk"] for o in collected["orphans"]] == ["c0"]
+
+        adopted = reconcile(
+            metadata, inventories, grace_seconds=50, adopt=True, now=120.0, collect_unknown=True
+        )
+        assert adopted["orphans"] == []
+
+    def test_reconcile_drops_stale_replicas(self):
+        metadata = {"a": {"chunks": [{"chunk": "a0", "index": 0, "node": "n1", "checksum": "c"}]}}
+        inventories = {"n1": [_manifest("a0", "a", 0, checksum="x")]}
+        report = reconcile(metadata, inventories, grace_seconds=0, now=120.0)
+
+        assert [o["chunk"] for o in report["orphans"]] == ["a0"]
+        assert report["missing"] == [{"node": "n1", "chunk": "a0", "file": "a"}]
+
+    def test_reconcile_reattaches_replicas_of_current_upload(self):
+        metadata = {"a": {"uploaded_at": 1.0, "chunks": [
+            {"chunk": "a0", "index": 0, "node": "n1", "checksum": "c"},
+        ]}}
+        inventories = {
+            "n1": [_manifest("a0", "a", 0)],
+            "n2": [_manifest("a0", "a", 0), _manifest("a0", "a", 0, checksum="x")],
+            "n3": [_manifest("a0", "a", 0, uploaded_at=0.5)],
+        }
+        report = reconcile(metadata, inventories, grace_seconds=0, now=120.0)
+
+        assert report["reattached"] == [
+            {"node": "n2", "chunk": "a0", "file": "a", "index": 0, "checksum": "c"}
+        ]
+        assert [o["node"] for o in report["orphans"]] == ["n2", "n3"]
+
+    def test_merge_keeps_replicas_from_unscanned_nodes(self):
+        existing = {
+            "a": {"uploaded_at": 1.0, "chunks": [{"chunk": "a0", "index": 0, "node": "n2"}]},
+            "b": {"uploaded_at": 1.0, "chunks": [{"chunk": "b0", "index": 0, "node": "n2"}]},
+        }
+        rebuilt = {
+            "a": {"uploaded_at": 1.0, "chunks": [{"chunk": "a0", "index": 0, "node": "n1"}]},
+            "c": {"uploaded_at": 3.0, "chunks": [{"chunk": "c0", "index": 0, "node": "n1"}]},
+        }
+        merged = merge_metadata(existing, rebuilt)
+
+        assert [e["node"] for e in merged["a"]["chunks"]] == ["n1", "n2"]
+        assert sorted(merged) == ["a", "b", "c"]
+
+
+class TestRecoveryEndpoints:
+    """Test recovery against stand-in nodes"""
+
+    def test_recover_after_metadata_loss(self, cluster):
+        main, client, nodes = cluster
+        payload = os.urandom(2500)
+        client.post("/upload", files={"file": ("data.bin", payload)})
+
+        os.remove(main.METADATA_FILE)
+        main.REGISTERED_NODES.clear()
+        report = client.post(
+            "/recover", params={"nodes": [n.url for n in nodes]}, headers=API_HEADERS
+        ).json()
+
+        assert report["files"] == 1 and report["failed_nodes"] == []
+        assert main.REGISTERED_NODES == {n.url for n in nodes}
+        assert client.get("/download/data.bin").content == payload
+        assert client.get("/files").json()["files"] == ["data.bin"]
+
+    def test_recover_with_unreachable_node_keeps_metadata(self, cluster):
+        main, client, nodes = cluster
+        client.post("/upload", files={"file": ("data.bin", os.urandom(2500))})
+        before = _replicas(main.load_metadata()["data.bin"])
+        nodes[1].stop()
+
+        report = client.post("/recover", headers=API_HEADERS).json()
+        assert report["failed_nodes"] == [nodes[1].url] and report["merged"]
+        assert _replicas(main.load_metadata()["data.bin"]) == before
+
+        forced = client.post("/recover", params={"force": True}, headers=API_HEADERS).json()
+        assert not forced["merged"]
+        assert {e["node"] for e in main.load_metadata()["data.bin"]["chunks"]} == {nodes[0].url}
+
+    def test_reconcile_reattaches_dropped_replica(self, cluster):
+        main, client, nodes = cluster
+        payload = os.urandom(2500)
+        client.post("/upload", files={"file": ("data.bin", payload)})
+        metadata = main.load_metadata()
+        full = list(metadata["data.bin"]["chunks"])
+        metadata["data.bin"]["chunks"] = full[::2]
+        main.save_metadata(metadata)
+
+        report = client.post("/reconcile", params={"gc": True}, headers=API_HEADERS).json()
+
+        assert report["orphans"] == [] and report["collected"] == 0
+        assert len(report["reattached"]) == len(full) - len(full[::2])
+        assert _replicas(main.load_metadata()["data.bin"]) == _replicas({"chunks": full})
+        assert client.get("/download/data.bin").content == payload
+
+    def test_reconcile_collects_unknown_files_only_when_asked(self, cluster):
+        main, client, nodes = cluster
+        client.post("/upload", files={"file": ("keep.bin", os.urandom(1500))})
+        client.post("/upload", files={"file": ("lost.bin", os.urandom(1500))})
+        metadata = main.load_metadata()
+        del metadata["lost.bin"]
+        main.save_metadata(metadata)
+
+        report = client.post("/reconcile", params={"gc": True}, headers=API_HEADERS).json()
+        assert report["unknown_files"] == ["lost.bin"]
+        assert report["collected"] == 0
+
+        report = client.post(
+            "/reconcile", params={"gc": True, "collect_unknown": True}, headers=API_HEADERS
+        ).json()
+        assert report["collected"] == 4
+        stored = [name for node in nodes for name in node.server.config.app.state.chunks]
+        assert all("lost" not in name for name in stored)
+        assert client.get("/files").json()["files"] == ["keep.bin"]
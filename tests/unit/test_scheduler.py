@@ -0,0 +1,113 @@
+"""
+Unit tests for tenant rate limiting and fair transfer scheduling
+"""
+import threading
+
+from fastapi.testclient import TestClient
+
+from controller.scheduler import NodeQueue, TokenBucket, TransferScheduler
+
+
+class TestTokenBucket:
+    """Test byte token buckets"""
+
+    def test_unlimited_bucket_never_waits(self):
+        bucket = TokenBucket(rate=0, burst=0)
+        assert bucket.reserve(10 ** 9) == 0
+        assert bucket.delay() == 0
+
+    def test_reserve_goes_into_debt(self):
+        bucket = TokenBucket(rate=1000, burst=1000)
+        assert bucket.reserve(1000) == 0
+        assert 1.9 < bucket.reserve(2000) <= 2.0
+        assert bucket.delay() > 1.9
+
+
+class TestTransferScheduler:
+    """Test per-tenant bucket bookkeeping"""
+
+    def test_full_buckets_are_evicted(self):
+        scheduler = TransferScheduler(default_rate=1000, sweep_interval=0)
+        scheduler.bucket("idle")
+        scheduler.bucket("busy").reserve(5000)
+        scheduler.bucket("other")
+
+        assert set(scheduler._buckets) == {"busy", "other"}
+
+
+class TestNodeQueue:
+    """Test weighted fair ordering of queued transfers"""
+
+    def test_small_flow_is_not_stuck_behind_bulk_flow(self):
+        gate = threading.Event()
+        order = []
+        queue = NodeQueue("node", workers=1, flow_window=100)
+
+        # Occupy the only worker so the rest of the jobs queue up
+        blocker = queue.submit("warmup", 1, 1, gate.wait)
+        bulk = [queue.submit("bulk", 1, 1000, order.append, f"bulk{i}") for i in range(10)]
+        small = queue.submit("small", 1, 1000, order.append, "small")
+        gate.set()
+        for future in [blocker, small] + bulk:
+            future.result(timeout=5)
+
+        assert order.index("small") <= 1
+
+    def test_weight_gives_larger_share(self):
+        gate = threading.Event()
+        order = []
+        queue = NodeQueue("node", workers=1, flow_window=100)
+
+        blocker = queue.submit("warmup", 1, 1, gate.wait)
+        futures = [queue.submit("light", 1, 100, order.append, "light") for _ in range(4)]
+        futures += [queue.submit("heavy", 4, 100, order.append, "heavy") for _ in range(4)]
+        gate.set()
+        for future in [blocker] + futures:
+            future.result(timeout=5)
+
+        assert order[:5].count("heavy") == 4
+
+
+class TestAdmission:
+    """Test 429 backpressure from the controller"""
+
+    def test_tenant_over_rate_gets_retry_after(self, monkeypatch):
+        from controller import main
+
+        scheduler = TransferScheduler(tenants={"bulk": {"rate": 100, "burst": 100}})
+        scheduler.bucket("bulk").reserve(10_000)
+        monkeypatch.setattr(main, "SCHEDULER", scheduler)
+        client = TestClient(main.app)
+
+        res = client.post(
+            "/upload", files={"file": ("a.bin", b"x")}, headers={"x-tenant-id": "bulk"}
+        )
+        assert res.status_code == 429
+        assert int(res.headers["retry-after"]) > main.TENANT_MAX_DELAY
+
+        other = client.get("/download/missing.bin", headers={"x-tenant-id": "interactive"})
+        assert other.status_code == 200
+
+    def test_unconfigured_tenant_header_is_ignored(self, monkeypatch):
+        from controller import main
+
+        scheduler = TransferScheduler(tenants={"bulk": {"rate": 100, "burst": 100}})
+        monkeypatch.setattr(main, "SCHEDULER", scheduler)
+
+        assert main.get_tenant("bulk", None) == "bulk"
+        assert main.get_tenant("made-up", None) == "anonymous"
+        assert main.get_tenant("made-up", main.API_KEY) == "api"
+        assert main.get_tenant(None, "wrong-key") == "anonymous"
+
+    def test_download_from_saturated_nodes_gets_retry_after(self, cluster, monkeypatch):
+        main, client, nodes = cluster
+        client.post("/upload", files={"file": ("a.bin", b"x" * 2500)})
+
+        # One saturated node is avoided by reading from the other replica
+        monkeypatch.setattr(main.SCHEDULER, "saturated", lambda node: node == nodes[0].url)
+        assert client.get("/download/a.bin").content == b"x" * 2500
+
+        monkeypatch.setattr(main.SCHEDULER, "saturated", lambda node: True)
+        res = client.get("/download/a.bin")
+        assert res.status_code == 429
+        assert res.headers["retry-after"] == str(main.QUEUE_RETRY_AFTER)
@@ -1,9 +1,22 @@
 import os
 
-def split_file(file_path, chunk_size=1024 * 1024):  # Default: 1MB chunks
+# Cluster chunking policy: aim for TARGET_CHUNK_COUNT chunks per file,
+# clamped to [MIN_CHUNK_SIZE, MAX_CHUNK_SIZE]
+MIN_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+TARGET_CHUNK_COUNT = 64
+
+def choose_chunk_size(file_size, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE,
+                      target_chunks=TARGET_CHUNK_COUNT):
+    # Round up to a power of two so chunk boundaries stay aligned
+    ideal = -(-file_size // target_chunks)
+    size = 1 << max(0, (ideal - 1).bit_length())
+    return max(min_size, min(max_size, size))
+
+def split_file(file_path, chunk_size=1024 * 1024, base_name=None):  # Default: 1MB chunks
+    # Chunks are named after base_name, or the file itself if not given
     chunks = []
-    base_name = os.path.basename(file_path)
-    name, ext = os.path.splitext(base_name)
+    name, ext = os.path.splitext(base_name or os.path.basename(file_path))
 
     with open(file_path, 'rb') as f:
         i = 0
@@ -19,13 +32,17 @@ def save_chunk(chunk_name, data, node_path):
     with open(os.path.join(node_path, chunk_name), 'wb') as f:
         f.write(data)
 
-def assemble_file(chunks):
-    # Sort chunks based on numeric index extracted from filename
-    def extract_index(name):
-        parts = name.split("_chunk")
-        if len(parts) > 1:
-            return int(parts[1].split(".")[0])
-        return 0
+def chunk_span(start, end, chunk_size):
+    # Indexes of the first and last chunk covering bytes start..end (inclusive)
+    return start // chunk_size, end // chunk_size
 
-    chunks.sort(key=lambda x: extract_index(x[0]))
-    return b''.join(chunk for _, chunk in chunks)
+def assemble_file(chunks, chunk_size=None):
+    # chunks: (index, data) pairs; every chunk but the last must be chunk_size long
+    ordered = sorted(chunks, key=lambda x: x[0])
+    if chunk_size is not None:
+        for index, data in ordered[:-1]:
+            if len(data) != chunk_size:
+                raise ValueError(
+                    f"Chunk {index} is {len(data)} bytes, expected {chunk_size}"
+                )
+    return b''.join(data for _, data in ordered)
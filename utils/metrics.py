@@ -0,0 +1,317 @@
+"""
+Lightweight metrics and profiling helpers shared by the controller and nodes.
+
+Metrics are rendered in the Prometheus text exposition format so they can be
+scraped without pulling in an extra client library.
+"""
+import collections
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import PlainTextResponse
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[0][-1] if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._values.items()]
+        lines = []
+        bucket_names = self.labelnames + ("le",)
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(bucket_names, key + (repr(bound),))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(bucket_names, key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {counts[-1]}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))  # type: ignore
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        return self._register(metric)  # type: ignore
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads at a fixed interval.
+
+    Samples are aggregated as folded stacks ("outer;inner count") which can be
+    fed straight into flamegraph tooling.
+    """
+
+    def __init__(self) -> None:
+        self._stacks: collections.Counter = collections.Counter()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.interval = 0.01
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01) -> None:
+        if interval <= 0:
+            raise ValueError("Profiler interval must be positive")
+        if self.running:
+            return
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                current = frame
+                while current is not None:
+                    code = current.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{current.f_lineno})")
+                    current = current.f_back
+                with self._lock:
+                    self._stacks[";".join(reversed(stack))] += 1
+            with self._lock:
+                self.samples += 1
+
+    def folded(self) -> str:
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "\n".join(f"{stack} {count}" for stack, count in stacks)
+
+
+def instrument_app(
+    app: FastAPI,
+    registry: Registry,
+    profiler: Optional[SamplingProfiler] = None,
+    dependencies: Optional[list] = None,
+) -> None:
+    """Add request metrics middleware plus /metrics and profiler routes to an app."""
+    request_seconds = registry.histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by endpoint",
+        ("method", "endpoint", "status"),
+    )
+    in_flight = registry.gauge(
+        "http_requests_in_flight", "HTTP requests currently being served", ("method",)
+    )
+
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):  # type: ignore
+        start = time.perf_counter()
+        status = "500"
+        in_flight.inc(method=request.method)
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            in_flight.dec(method=request.method)
+            # Use the route template so path parameters don't explode cardinality
+            route = request.scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            request_seconds.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                endpoint=endpoint,
+                status=status,
+            )
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics() -> str:
+        return registry.render()
+
+    if profiler is None:
+        return
+
+    @app.post("/debug/profiler", dependencies=dependencies or [])
+    def toggle_profiler(
+        enabled: bool, interval: float = Query(0.01, ge=0.001), reset: bool = False
+    ) -> dict:
+        if reset:
+            profiler.reset()
+        if enabled:
+            profiler.start(interval)
+        else:
+            profiler.stop()
+        return {"running": profiler.running, "samples": profiler.samples}
+
+    @app.get(
+        "/debug/profiler",
+        response_class=PlainTextResponse,
+        dependencies=dependencies or [],
+    )
+    def profiler_output() -> str:
+        return profiler.folded()
@@ -5,19 +5,29 @@ import StatusBar from "./components/StatusBar";
 import { useEffect, useState } from "react";
 import { api } from "./api";
 
+const PAGE_SIZE = 100;
+
 function App() {
   const [files, setFiles] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [prefix, setPrefix] = useState("");
+  // Cursors of the pages before the current one, for "Prev"
+  const [cursors, setCursors] = useState([]);
+  const [cursor, setCursor] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [error, setError] = useState("");
 
   useEffect(() => {
     fetchFiles();
-  }, []);
-
-  const [error, setError] = useState("");
+  }, [prefix, cursor]);
 
   const fetchFiles = () => {
-    api.get("/files")
+    // /files is paginated; only the page being shown is requested
+    api.get("/files", { params: { prefix, cursor, limit: PAGE_SIZE } })
       .then(res => {
         setFiles(res.data.files || []);
+        setTotal(res.data.total ?? (res.data.files || []).length);
+        setNextCursor(res.data.next_cursor || null);
         setError("");
       })
       .catch(err => {
@@ -26,12 +36,28 @@ function App() {
       });
   };
 
-  const handleUploadSuccess = (newFile) => {
-    setFiles(prev => [...prev, newFile]);
+  const changePrefix = (value) => {
+    setPrefix(value);
+    setCursors([]);
+    setCursor(null);
+  };
+
+  const nextPage = () => {
+    setCursors(prev => [...prev, cursor]);
+    setCursor(nextCursor);
   };
 
-  const handleFileDeleted = (deletedFile) => {
-    setFiles(prev => prev.filter(file => file !== deletedFile));
+  const prevPage = () => {
+    setCursor(cursors[cursors.length - 1] ?? null);
+    setCursors(prev => prev.slice(0, -1));
+  };
+
+  const handleUploadSuccess = () => {
+    fetchFiles();
+  };
+
+  const handleFileDeleted = () => {
+    fetchFiles();
   };
 
   return (
@@ -47,6 +73,32 @@ function App() {
           </div>
         )}
         <UploadForm onUploadSuccess={handleUploadSuccess} />
+        <div className="max-w-xl mx-auto mt-10 flex items-center justify-between space-x-3">
+          <input
+            type="text"
+            value={prefix}
+            onChange={e => changePrefix(e.target.value)}
+            placeholder="Filter by prefix"
+            className="flex-1 rounded-lg border border-gray-300 px-3 py-2 text-sm"
+          />
+          <span className="text-sm text-gray-700">
+            {total} file{total === 1 ? "" : "s"}
+          </span>
+          <button
+            onClick={prevPage}
+            disabled={cursors.length === 0}
+            className="text-sm text-indigo-700 disabled:text-gray-400"
+          >
+            Prev
+          </button>
+          <button
+            onClick={nextPage}
+            disabled={!nextCursor}
+            className="text-sm text-indigo-700 disabled:text-gray-400"
+          >
+            Next
+          </button>
+        </div>
         <FileList files={files} onFileDeleted={handleFileDeleted} />
       </div>
     </div>
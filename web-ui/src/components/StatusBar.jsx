@@ -14,7 +14,7 @@ export default function StatusBar() {
           api.get("/files"),
         ]);
         setNodes(nRes.data.nodes || []);
-        setFilesCount((fRes.data.files || []).length);
+        setFilesCount(fRes.data.total ?? (fRes.data.files || []).length);
         setError("");
       } catch (e) {
         setError("Backend unreachable");